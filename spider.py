@@ -2,14 +2,66 @@
 # -*- coding: utf-8 -*-
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import openpyxl
-from datetime import datetime, timedelta, timezone
+from openpyxl.utils import get_column_letter
 import sys
 from getpass import getpass
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import threading
 import json
 import os
+import sqlite3
+import time
+
+try:
+    # orjson解析大体积JSON明显快于标准库，未安装时回退到json
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# 并发扫描的线程数，同时也是连接池大小，保证每个线程都能复用连接
+MAX_WORKERS = 20
+
+# 精简格式的包文档，不含README和各版本的描述、作者，体积小一个数量级
+ABBREVIATED_ACCEPT = 'application/vnd.npm.install-v1+json'
+
+# 扫描窗口 [起点, 终点)，ISO-8601时间字符串可直接按字典序比较
+YEAR_2025_START = '2025-01-01'
+YEAR_2025_END = '2026-01-01'
+
+# time字段中不是版本号的键
+NON_VERSION_KEYS = frozenset(('created', 'modified'))
+
+# 缓存内容格式版本，修改filter_versions_last_year的输出字段时需递增
+CACHE_FORMAT = 1
+
+# 跨运行共享的包缓存（包名 -> ETag与2025年版本信息），放在用户目录下，与运行目录无关。
+# 缓存的是筛选后的结果，文件名包含扫描窗口和格式版本，二者变化时自动换用新的缓存
+CACHE_DB = os.path.join(
+    os.path.expanduser('~'), '.cache', 'npm-spider',
+    f'cache-v{CACHE_FORMAT}-{YEAR_2025_START}-{YEAR_2025_END}.db'
+)
+
+# 包未变化（HTTP 304）时get_package_versions返回的标记
+NOT_MODIFIED = object()
+
+# 精简文档显示包在2025年前就已停止更新时get_package_versions返回的标记
+NO_RECENT_VERSIONS = object()
+
+
+def loads_json(content):
+    """解析JSON（bytes或str），已安装orjson时优先使用"""
+    return orjson.loads(content) if orjson else json.loads(content)
+
+
+def dumps_json(data, indent=False):
+    """将数据序列化为UTF-8编码的JSON bytes，已安装orjson时优先使用"""
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(data, indent=2 if indent else None, ensure_ascii=False).encode('utf-8')
 
 
 def setup_proxy(username, password, http_proxy, https_proxy):
@@ -30,40 +82,149 @@ def setup_proxy(username, password, http_proxy, https_proxy):
     return proxies
 
 
+def create_session(access_token, max_workers):
+    """创建所有扫描线程共享的HTTP会话（复用连接，自动重试）"""
+    session = requests.Session()
+    session.headers.update({
+        'Authorization': f'Bearer {access_token}',
+        'Accept': 'application/json'
+    })
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+    # 只访问registry一个主机；连接池大小与线程数一致，各线程无需重新握手
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+    session.mount('https://', adapter)
+    return session
+
+
 def read_npm_packages(excel_file):
     """从Excel文件读取npm库名称列表"""
     try:
-        wb = openpyxl.load_workbook(excel_file)
+        # 只读模式按需解析行，不加载样式和其他列
+        wb = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
         ws = wb.active
-        packages = []
         
         # 读取第一列的所有非空值（跳过表头）
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if row[0]:  # 如果第一列有值
-                packages.append(str(row[0]).strip())
+        packages = [str(row[0]).strip() for row in ws.iter_rows(min_row=2, max_col=1, values_only=True) if row[0]]
         
         wb.close()
-        return packages
+        # 去除重复的包名，保留首次出现的顺序
+        unique_packages = list(dict.fromkeys(packages))
+        if len(unique_packages) != len(packages):
+            print(f"✓ 去重后 {len(unique_packages)} 个npm包")
+        return unique_packages
     except Exception as e:
         print(f"读取Excel文件失败: {e}")
         sys.exit(1)
 
 
-def get_package_versions(package_name, access_token, proxies):
-    """获取npm包的版本信息"""
+_cache_local = threading.local()
+
+# Ctrl+C后置位，尚未开始的扫描任务直接放弃
+interrupt_flag = threading.Event()
+
+
+def get_cache_connection():
+    """获取当前线程的缓存数据库连接（sqlite连接不能跨线程使用）"""
+    conn = getattr(_cache_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(CACHE_DB), exist_ok=True)
+        conn = sqlite3.connect(CACHE_DB, timeout=30)
+        # WAL模式下多个线程的读写互不阻塞
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS pkg('
+            'name TEXT PRIMARY KEY, etag TEXT, fetched_at INT, versions_json TEXT)'
+        )
+        _cache_local.conn = conn
+    return conn
+
+
+def cache_lookup(package_name):
+    """查询缓存，返回 (ETag, 版本信息)，未缓存时返回None"""
+    row = get_cache_connection().execute(
+        'SELECT etag, versions_json FROM pkg WHERE name = ?', (package_name,)
+    ).fetchone()
+    if row is None:
+        return None
+    etag, versions_json = row
+    return etag, loads_json(versions_json)
+
+
+def cache_store(package_name, etag, versions):
+    """写入或更新包的缓存"""
+    versions_json = dumps_json(versions).decode('utf-8')
+    conn = get_cache_connection()
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO pkg(name, etag, fetched_at, versions_json) VALUES (?, ?, ?, ?)',
+            (package_name, etag, int(time.time()), versions_json)
+        )
+
+
+def load_progress(progress_file):
+    """读取上次中断前保存的进度（包名 -> 版本信息）"""
+    if not os.path.exists(progress_file):
+        return {}
+    try:
+        with open(progress_file, 'rb') as f:
+            content = f.read()
+        return loads_json(content)
+    except (OSError, ValueError) as e:
+        print(f"读取进度文件失败，将重新扫描: {e}")
+        return {}
+
+
+def save_progress(progress_data, progress_file):
+    """保存扫描进度，程序中断后再次运行可跳过已完成的包"""
+    content = dumps_json(progress_data, indent=True)
+    # 先写临时文件再替换，中途崩溃也不会留下截断的进度文件
+    tmp_file = progress_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_file, progress_file)
+
+
+def get_package_versions(package_name, session, proxies, etag=None):
+    """获取npm包的版本信息，返回 (包数据, ETag)
+
+    服务器返回304时包数据为NOT_MODIFIED；包在2025年前就已停止更新时为NO_RECENT_VERSIONS。
+    proxies须在每次请求时传入：设置在会话上的代理会被HTTP(S)_PROXY环境变量覆盖
+    """
     url = f"https://registry.npmjs.org/{package_name}"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Accept': 'application/json'
-    }
+    headers = {'If-None-Match': etag} if etag else None
     
     try:
-        response = requests.get(url, headers=headers, proxies=proxies, timeout=30)
+        if not etag:
+            # 先取精简文档：2025年前就没再更新过的包无需下载完整文档
+            response = session.get(url, headers={'Accept': ABBREVIATED_ACCEPT}, proxies=proxies, timeout=30)
+            response.raise_for_status()
+            abbreviated = loads_json(response.content)
+            modified = abbreviated.get('modified', '')
+            if modified and modified < YEAR_2025_START:
+                return NO_RECENT_VERSIONS, None
+        
+        response = session.get(url, headers=headers, proxies=proxies, timeout=30)
+        if response.status_code == 304:
+            return NOT_MODIFIED, etag
         response.raise_for_status()
-        return response.json()
+        package_data = loads_json(response.content)
+        return package_data, response.headers.get('ETag')
     except requests.exceptions.RequestException as e:
         print(f"获取包 {package_name} 信息失败: {e}")
-        return None
+        return None, None
+
+
+def _author_from_dict(author):
+    return author.get('name', '')
+
+
+def _author_from_other(author):
+    return str(author) if author else ''
+
+
+# author字段可能是 {"name": ...} 或字符串，按类型分派避免逐个版本做isinstance判断
+_AUTHOR = {dict: _author_from_dict}.get
 
 
 def filter_versions_last_year(package_data):
@@ -71,46 +232,56 @@ def filter_versions_last_year(package_data):
     if not package_data or 'time' not in package_data:
         return []
     
-    # 2025年1月1日 00:00:00 UTC
-    year_2025_start = datetime(2025, 1, 1, 0, 0, 0, tzinfo=timezone.utc)
-    # 2026年1月1日 00:00:00 UTC
-    year_2025_end = datetime(2026, 1, 1, 0, 0, 0, tzinfo=timezone.utc)
     versions_info = []
+    versions_info_append = versions_info.append
     
-    time_info = package_data.get('time', {})
+    time_items = package_data.get('time', {}).items()
     versions = package_data.get('versions', {})
     
-    for version, publish_time in time_info.items():
-        if version in ['created', 'modified']:
+    for version, publish_time in time_items:
+        # 跳过非版本条目及非字符串的值（如撤销发布时写入的unpublished对象）
+        if version in NON_VERSION_KEYS or not isinstance(publish_time, str):
             continue
         
-        try:
-            publish_date = datetime.fromisoformat(publish_time.replace('Z', '+00:00'))
-            if year_2025_start <= publish_date < year_2025_end:
-                version_data = versions.get(version, {})
-                versions_info.append({
-                    'version': version,
-                    'publish_time': publish_time,
-                    'description': version_data.get('description', ''),
-                    'author': version_data.get('author', {}).get('name', '') if isinstance(version_data.get('author'), dict) else str(version_data.get('author', '')),
-                    'dependencies': len(version_data.get('dependencies', {}))
-                })
-        except Exception as e:
-            # 静默处理错误，不打印
-            continue
+        # 发布时间均为UTC的ISO-8601字符串，字典序即时间顺序
+        if YEAR_2025_START <= publish_time < YEAR_2025_END:
+            version_data = versions.get(version, {})
+            # 跳过格式异常的版本条目，不影响同一包的其他版本
+            if not isinstance(version_data, dict):
+                continue
+            author = version_data.get('author')
+            versions_info_append({
+                'version': version,
+                'publish_time': publish_time,
+                'description': version_data.get('description', ''),
+                'author': (_AUTHOR(type(author)) or _author_from_other)(author),
+                'dependencies': len(version_data.get('dependencies') or {})
+            })
     
     # 按发布时间排序
     versions_info.sort(key=lambda x: x['publish_time'], reverse=True)
     return versions_info
 
 
-def scan_single_package(package_name, access_token, proxies, lock, progress):
+def scan_single_package(package_name, session, proxies, lock, progress):
     """扫描单个npm包的版本信息（用于多线程）"""
+    if interrupt_flag.is_set():
+        return package_name, None
     try:
-        package_data = get_package_versions(package_name, access_token, proxies)
+        cached = cache_lookup(package_name)
+        etag = cached[0] if cached else None
+        package_data, etag = get_package_versions(package_name, session, proxies, etag)
         
-        if package_data:
+        if package_data is NOT_MODIFIED:
+            result = cached[1]
+            status_msg = f"✓ 未变化，沿用 {len(result)} 个2025年的版本"
+        elif package_data is NO_RECENT_VERSIONS:
+            result = []
+            status_msg = "✓ 2025年前已停止更新，找到 0 个2025年的版本"
+        elif package_data:
             versions = filter_versions_last_year(package_data)
+            if etag:
+                cache_store(package_name, etag, versions)
             result = versions
             status_msg = f"✓ 找到 {len(versions)} 个2025年的版本"
         else:
@@ -119,7 +290,18 @@ def scan_single_package(package_name, access_token, proxies, lock, progress):
         
         # 线程安全地更新进度
         with lock:
+            if result is not None:
+                progress['data'][package_name] = result
             progress['completed'] += 1
+            # 保存间隔逐次翻倍（上限500），避免反复重写越来越大的进度文件
+            if len(progress['data']) >= progress['next_save']:
+                # 保存失败只影响断点续扫，不影响本包的扫描结果
+                try:
+                    save_progress(progress['data'], progress['file'])
+                except OSError as e:
+                    print(f"保存进度失败: {e}")
+                progress['save_interval'] = min(progress['save_interval'] * 2, 500)
+                progress['next_save'] = len(progress['data']) + progress['save_interval']
             print(f"[{progress['completed']}/{progress['total']}] {package_name}: {status_msg}")
         
         return package_name, result
@@ -130,74 +312,66 @@ def scan_single_package(package_name, access_token, proxies, lock, progress):
         return package_name, None
 
 
+def write_sheet(wb, title, headers, rows):
+    """向只写工作簿追加一个sheet，收集数据时同步计算列宽"""
+    ws = wb.create_sheet(title)
+    col_widths = [len(h) for h in headers]
+    buffered = []
+    
+    def emit(row):
+        buffered.append(row)
+        for i, value in enumerate(row):
+            if value:
+                col_widths[i] = max(col_widths[i], len(str(value)))
+    
+    for row in rows:
+        emit(row)
+    
+    # 只写模式下列宽必须在写入第一行之前设置
+    for i, width in enumerate(col_widths):
+        ws.column_dimensions[get_column_letter(i + 1)].width = min(width + 2, 50)
+    
+    ws.append(headers)
+    for row in buffered:
+        ws.append(row)
+
+
 def write_results_to_excel(results, output_file):
     """将扫描结果写入Excel文件"""
-    wb = openpyxl.Workbook()
+    # 只写模式按行流式写盘，内存占用与行数无关
+    wb = openpyxl.Workbook(write_only=True)
     
     # 第一个sheet：详细版本信息
-    ws1 = wb.active
-    ws1.title = "详细版本信息"
-    
-    # 写入表头
-    headers = ['包名', '版本', '发布时间', '描述', '作者', '依赖数量']
-    ws1.append(headers)
-    
-    # 写入数据
-    for package_name, versions in results.items():
-        if versions is None:
-            ws1.append([package_name, '查找失败', '', '', '', ''])
-        elif not versions:
-            ws1.append([package_name, '未找到2025年的版本', '', '', '', ''])
-        else:
-            for version_info in versions:
-                ws1.append([
-                    package_name,
-                    version_info['version'],
-                    version_info['publish_time'],
-                    version_info['description'],
-                    version_info['author'],
-                    version_info['dependencies']
-                ])
+    def detail_rows():
+        for package_name, versions in results.items():
+            if versions is None:
+                yield (package_name, '查找失败', '', '', '', '')
+            elif not versions:
+                yield (package_name, '未找到2025年的版本', '', '', '', '')
+            else:
+                for version_info in versions:
+                    yield (
+                        package_name,
+                        version_info['version'],
+                        version_info['publish_time'],
+                        version_info['description'],
+                        version_info['author'],
+                        version_info['dependencies']
+                    )
     
-    # 调整列宽
-    for column in ws1.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if cell.value:
-                    max_length = max(max_length, len(str(cell.value)))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws1.column_dimensions[column_letter].width = adjusted_width
+    write_sheet(wb, "详细版本信息", ['包名', '版本', '发布时间', '描述', '作者', '依赖数量'], detail_rows())
     
     # 第二个sheet：统计信息
-    ws2 = wb.create_sheet(title="版本统计")
-    ws2.append(['库名', '2025年发布版本数量'])
+    def summary_rows():
+        for package_name, versions in results.items():
+            if versions is None:
+                yield (package_name, '查找失败')
+            else:
+                yield (package_name, len(versions))
     
-    # 写入统计数据
-    for package_name, versions in results.items():
-        if versions is None:
-            ws2.append([package_name, '查找失败'])
-        else:
-            ws2.append([package_name, len(versions)])
-    
-    # 调整统计页列宽
-    for column in ws2.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if cell.value:
-                    max_length = max(max_length, len(str(cell.value)))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws2.column_dimensions[column_letter].width = adjusted_width
+    write_sheet(wb, "版本统计", ['库名', '2025年发布版本数量'], summary_rows())
     
     wb.save(output_file)
-    print(f"\n扫描结果已保存到: {output_file}")
 
 
 def main():
@@ -234,6 +408,9 @@ def main():
         print("错误: 必须提供npm access token")
         sys.exit(1)
     
+    # 所有线程共享同一个会话，session.get可并发调用，无需加锁
+    session = create_session(access_token, MAX_WORKERS)
+    
     # 4. 读取npm包列表
     print(f"\n正在读取Excel文件: {input_file}")
     packages = read_npm_packages(input_file)
@@ -243,27 +420,57 @@ def main():
     print("\n开始扫描npm包版本信息...")
     print("使用多线程并发扫描，请稍候...\n")
     
-    results = {}
+    # 进度文件记录本次已完成的包，程序中断后再次运行时直接沿用
+    progress_file = input_file.replace('.xlsx', '') + '-进度.json'
+    progress_data = load_progress(progress_file)
+    results = {package: progress_data[package] for package in packages if package in progress_data}
+    if results:
+        print(f"✓ 从上次中断处继续，跳过已完成的 {len(results)} 个包\n")
+    pending_packages = [package for package in packages if package not in results]
+    
     lock = threading.Lock()
-    progress = {'completed': 0, 'total': len(packages)}
+    progress = {
+        'completed': len(results), 'total': len(packages),
+        'data': progress_data, 'file': progress_file,
+        'save_interval': 10, 'next_save': len(progress_data) + 10
+    }
     
     # 使用线程池并发扫描，max_workers控制并发数
-    with ThreadPoolExecutor(max_workers=15) as executor:
-        # 提交所有任务
-        future_to_package = {
-            executor.submit(scan_single_package, package, access_token, proxies, lock, progress): package 
-            for package in packages
-        }
-        
-        # 收集结果
-        for future in as_completed(future_to_package):
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            # 滑动窗口：最多保持max_workers个进行中的任务，完成一个再提交一个，
+            # 避免一次性为所有包创建future
+            package_iter = iter(pending_packages)
+            future_to_package = {}
             try:
-                package_name, result = future.result()
-                results[package_name] = result
-            except Exception as e:
-                package_name = future_to_package[future]
-                results[package_name] = None
-                print(f"处理 {package_name} 时发生异常: {e}")
+                while True:
+                    for package in package_iter:
+                        future = executor.submit(scan_single_package, package, session, proxies, lock, progress)
+                        future_to_package[future] = package
+                        if len(future_to_package) >= MAX_WORKERS:
+                            break
+                    if not future_to_package:
+                        break
+                    
+                    # 收集已完成任务的结果
+                    done, _ = wait(future_to_package, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        package_name = future_to_package.pop(future)
+                        try:
+                            package_name, result = future.result()
+                            results[package_name] = result
+                        except Exception as e:
+                            results[package_name] = None
+                            print(f"处理 {package_name} 时发生异常: {e}")
+            except KeyboardInterrupt:
+                interrupt_flag.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+                print("\n检测到中断，等待进行中的请求结束并保存进度，再次运行可继续扫描")
+                sys.exit(130)
+    finally:
+        # 正常结束或Ctrl+C中断时都保存一次
+        with lock:
+            save_progress(progress_data, progress_file)
     
     # 6. 输出结果到Excel
     print("\n正在生成结果文件...")
@@ -271,7 +478,17 @@ def main():
     if output_file == input_file:
         output_file = input_file.replace('.xlsx', '') + '-扫描结果.xlsx'
     
-    write_results_to_excel(results, output_file)
+    # 在后台线程写Excel，同时输出统计信息
+    write_errors = []
+    
+    def write_output():
+        try:
+            write_results_to_excel(results, output_file)
+        except Exception as e:
+            write_errors.append(e)
+    
+    writer = threading.Thread(target=write_output)
+    writer.start()
     
     # 统计信息
     total_versions = sum(len(versions) for versions in results.values() if versions is not None)
@@ -282,6 +499,15 @@ def main():
     print(f"查找失败 {failed_count} 个npm包")
     print(f"找到 {total_versions} 个2025年发布的版本")
     print("=" * 60)
+    
+    writer.join()
+    if write_errors:
+        print(f"\n写入结果文件失败: {write_errors[0]}，进度已保留，可重新运行生成")
+        sys.exit(1)
+    print(f"\n扫描结果已保存到: {output_file}")
+    # 结果已完整输出，不再需要断点续扫
+    if os.path.exists(progress_file):
+        os.remove(progress_file)
 
 
 if __name__ == "__main__":